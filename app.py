@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers.classify_router import router as predict_router
 from routers.auth_router import router as auth_router
+from routers.export_router import router as export_router
+from routers.stream_router import router as stream_router
+from routers.profiling_router import router as profiling_router
 from utils.logging_config import setup_logger
 from contextlib import asynccontextmanager
 from core import database as db
@@ -51,6 +54,9 @@ app.add_middleware(
 logger.info("Registering routes")
 app.include_router(auth_router, prefix="/imagenes/auth")
 app.include_router(predict_router, prefix="/imagenes")
+app.include_router(export_router, prefix="/imagenes")
+app.include_router(stream_router, prefix="/imagenes")
+app.include_router(profiling_router, prefix="/imagenes")
 logger.info("Routes registered")
 logger.info("Imagenes app initializing completed")
 
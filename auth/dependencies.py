@@ -1,9 +1,10 @@
+import asyncio
 from auth.auth_handler import validate_token_with_iam
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from utils.logging_config import setup_logger
 from core.config import settings
-from fastapi import Depends, HTTPException,status
+from fastapi import Depends, HTTPException,status, WebSocket
 
 logger = setup_logger(__name__)
 
@@ -21,4 +22,49 @@ async def get_current_user_context(token: str = Depends(oauth2_scheme)) -> dict:
     except HTTPException:
         raise
     except Exception:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not get current user context to verify/validate authentication")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not get current user context to verify/validate authentication")
+
+async def get_websocket_user_context(websocket: WebSocket) -> dict:
+    """
+    Authenticates a WebSocket connection once for its whole lifetime.
+    The bearer token is read from the Authorization handshake header. Clients
+    that cannot set handshake headers (browsers) instead send
+    {"type": "auth", "token": "<JWT>"} as the first text message, in which case
+    the connection is accepted first. Tokens are never taken from the query
+    string, since the full URL ends up in uvicorn and proxy access logs.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+
+    if scheme.lower() != "bearer" or not token:
+        await websocket.accept()
+        try:
+            message = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_AUTH_TIMEOUT_SECONDS)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+        token = message.get("token") if isinstance(message, dict) and message.get("type") == "auth" else None
+
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    user = await validate_token_with_iam(token)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No active user for provided token")
+
+    logger.debug(f"Authenticated IAM user for websocket: {user.get('username')}")
+    return user
+
+def has_role(user: dict, role: str) -> bool:
+    roles = user.get("roles") or []
+    if isinstance(roles, str):
+        roles = [roles]
+
+    return user.get("role") == role or role in roles
+
+async def require_admin(user: dict = Depends(get_current_user_context)) -> dict:
+    if not has_role(user, settings.ADMIN_ROLE):
+        logger.warning(f"Non-admin user {user.get('username')} attempted an admin operation")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+
+    return user
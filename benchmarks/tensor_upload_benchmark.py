@@ -0,0 +1,92 @@
+"""
+Compares the per-request CPU cost of turning an upload body into a model-ready
+batch for PNG, JPEG, .npy and raw uint8 uploads. Model inference is excluded
+since it is identical for every format.
+
+Run from the repository root:
+    python -m benchmarks.tensor_upload_benchmark --channels 3 --iterations 200
+"""
+import argparse
+import io
+import time
+import numpy as np
+from PIL import Image
+import utils.image_utils as iutil
+
+SIZE = (512, 512)
+
+
+def decode_image(body: bytes, mode: str, input_shape) -> np.ndarray:
+    # Mirrors the multipart handlers in routers/classify_router.py
+    image = Image.open(io.BytesIO(body)).convert(mode)
+    if image.size != SIZE:
+        image = image.resize(SIZE)
+    processed = np.asarray(image) / 255.0
+    return processed.reshape((1,) + tuple(input_shape[1:]))
+
+
+def build_bodies(pixels: np.ndarray) -> dict:
+    image = Image.fromarray(pixels.squeeze())
+
+    png = io.BytesIO()
+    image.save(png, format="PNG")
+
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG", quality=95)
+
+    npy = io.BytesIO()
+    np.save(npy, pixels)
+
+    return {
+        "png": png.getvalue(),
+        "jpeg": jpeg.getvalue(),
+        "npy": npy.getvalue(),
+        "raw": pixels.tobytes(),
+    }
+
+
+def measure(fn, iterations: int) -> float:
+    fn()  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, choices=[1, 3], default=1)
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    input_shape = (None, *SIZE, args.channels)
+    mode = "L" if args.channels == 1 else "RGB"
+    shape_header = ",".join(str(dim) for dim in input_shape[1:])
+
+    # Smoothed noise compresses roughly like a real scan instead of pure noise
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=input_shape[1:], dtype=np.uint8)
+    pixels = ((noise.astype(np.uint16) + np.roll(noise, 1, axis=0) + np.roll(noise, 1, axis=1)) // 3).astype(np.uint8)
+
+    bodies = build_bodies(pixels)
+
+    decoders = {
+        "png": lambda: decode_image(bodies["png"], mode, input_shape),
+        "jpeg": lambda: decode_image(bodies["jpeg"], mode, input_shape),
+        "npy": lambda: iutil.tensor_to_batch(iutil.decode_npy(bodies["npy"]), input_shape),
+        "raw": lambda: iutil.tensor_to_batch(iutil.decode_raw_tensor(bodies["raw"], shape_header, "uint8"), input_shape),
+    }
+
+    results = {name: measure(fn, args.iterations) for name, fn in decoders.items()}
+
+    print(f"Input shape {input_shape[1:]}, {args.iterations} iterations, CPU ms per request")
+    print(f"{'format':<8}{'body KB':>10}{'cpu ms':>10}{'vs png':>10}{'vs jpeg':>10}")
+    for name, ms in results.items():
+        print(
+            f"{name:<8}{len(bodies[name]) / 1024:>10.1f}{ms:>10.3f}"
+            f"{results['png'] - ms:>10.3f}{results['jpeg'] - ms:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Offline bulk scoring for backfills and research, using the same model files,
+preprocessing and prediction records as the API without going through HTTP.
+
+Examples:
+    python bulk_score.py --input /data/archive --model custom --username backfill
+    python bulk_score.py --manifest files.txt --model rgb --output results.ndjson
+
+Files are decoded in a process pool while the main process runs batched
+inference. Every path whose result has been written is appended to the
+checkpoint file, and re-running the same command skips those paths. MongoDB
+writes are upserts keyed on the source path and model, so a batch written
+just before a crash and scored again on resume is not duplicated.
+
+Heavy imports (TensorFlow, the database client) happen inside main() so the
+spawned decode workers only load PIL, numpy and pydicom.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from utils.logging_config import setup_logger
+from core.config import settings
+import utils.image_utils as iutil
+
+logger = setup_logger("bulk_score")
+
+# --model -> (settings attribute with the model reference, model type label, PIL mode,
+# minimum encoded image size), matching /classify and /classify/rgb
+BULK_MODELS = {
+    "custom": ("CUSTOMCNN_MODEL", "Custom CNN", "L", iutil.MIN_IMAGE_BYTES),
+    "rgb": ("EFFECIENTNETCNN_MODEL", "EfficientNetB0", "RGB", 0),
+}
+
+SUPPORTED_EXTENSIONS = iutil.IMAGE_EXTENSIONS | iutil.DICOM_EXTENSIONS
+
+
+def iter_directory(root: str):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                yield os.path.join(dirpath, filename)
+
+
+def iter_manifest(manifest: str):
+    # One path per line; relative paths are resolved against the manifest's folder
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest) as lines:
+        for line in lines:
+            path = line.strip()
+            if path and not path.startswith("#"):
+                yield path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as lines:
+        return {line.rstrip("\n") for line in lines if line.strip()}
+
+
+class Progress:
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.started_at = time.perf_counter()
+        self.last_report = self.started_at
+        self.scored = 0
+        self.failed = 0
+        self.skipped = 0
+        self.decode_wait_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def report(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval_seconds:
+            return
+
+        self.last_report = now
+        elapsed = now - self.started_at
+        rate = self.scored / elapsed if elapsed else 0.0
+
+        logger.info(
+            f"Scored={self.scored} | Failed={self.failed} | Skipped={self.skipped} | "
+            f"Rate={rate:.1f} files/s | Elapsed={elapsed:.0f}s | "
+            f"DecodeWait={self.decode_wait_seconds:.1f}s | Inference={self.inference_seconds:.1f}s | "
+            f"Write={self.write_seconds:.1f}s"
+        )
+
+
+class ResultWriter:
+    """
+    Writes a batch of records either to MongoDB through CancerRecord bulk upserts
+    or to a local NDJSON file, then checkpoints the paths that were written.
+    """
+
+    def __init__(self, output: str, checkpoint: str):
+        self.output = output
+        self.ndjson = open(output, "a") if output else None
+        self.checkpoint = open(checkpoint, "a")
+
+    async def write(self, records: list, paths: list) -> int:
+        """
+        Returns how many records failed to write. Their paths are left out of
+        the checkpoint so the next run scores them again.
+        """
+        failed = set()
+
+        if self.ndjson:
+            for record in records:
+                self.ndjson.write(json.dumps(record, default=str) + "\n")
+            self.ndjson.flush()
+        else:
+            from entity.cancer_model import CancerRecord
+            from pymongo.errors import BulkWriteError
+            try:
+                await CancerRecord.upsert_cancer_predictions_by_source(records)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed.add(error["index"])
+                    logger.warning(f"Failed to write result for {paths[error['index']]}: {error.get('errmsg')}")
+
+        # Results are durable before the paths are marked as done
+        self.checkpoint.write("".join(f"{path}\n" for index, path in enumerate(paths) if index not in failed))
+        self.checkpoint.flush()
+        os.fsync(self.checkpoint.fileno())
+
+        return len(failed)
+
+    def close(self):
+        if self.ndjson:
+            self.ndjson.close()
+        self.checkpoint.close()
+
+
+async def score(args):
+    from tensorflow.keras.models import load_model  # type: ignore
+    from entity.cancer_model import CancerRecord
+    import numpy as np
+    from utils.model_utils import resolve_model_path
+
+    setting_name, model_type, mode, min_image_bytes = BULK_MODELS[args.model]
+    model_path = resolve_model_path(getattr(settings, setting_name), settings.MODEL_VERSION)
+    logger.info(f"Loading {model_type} from {model_path}")
+    model = load_model(model_path)
+    sample_shape = tuple(model.input_shape[1:])
+
+    progress = Progress(args.report_every)
+    done = load_checkpoint(args.checkpoint)
+    source = iter_manifest(args.manifest) if args.manifest else iter_directory(args.input)
+
+    def iter_pending():
+        # Counts only paths from this input that the checkpoint already covers
+        for path in source:
+            if path in done:
+                progress.skipped += 1
+            else:
+                yield path
+
+    pending_paths = iter_pending()
+    writer = ResultWriter(args.output, args.checkpoint)
+
+    # Keep enough decodes queued that workers never wait on inference, without reading the whole archive
+    max_queued = args.workers * 4 + args.batch_size
+    queued = deque()
+
+    async def flush(paths, arrays, modalities):
+        if not paths:
+            return
+
+        inference_start = time.perf_counter()
+        batch = (np.stack(arrays) / 255.0).reshape((len(arrays),) + sample_shape)
+        preds = model.predict(batch, batch_size=args.batch_size, verbose=0)
+        progress.inference_seconds += time.perf_counter() - inference_start
+
+        records = []
+        for path, modality, pred in zip(paths, modalities, preds):
+            label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
+            metadata = {
+                "filename": os.path.basename(path),
+                "model_type": model_type,
+                "input_format": "bulk",
+                "source_path": path
+            }
+            if modality:
+                metadata["modality"] = modality
+
+            records.append(CancerRecord.build_record(
+                metadata=metadata,
+                username=args.username,
+                prediction=label,
+                confidence=round(float(pred[0]), 3),
+                cnn_model_version=settings.MODEL_VERSION,
+                company_id=args.company_id
+            ))
+
+        write_start = time.perf_counter()
+        failed = await writer.write(records, paths)
+        progress.write_seconds += time.perf_counter() - write_start
+        progress.scored += len(records) - failed
+        progress.failed += failed
+        progress.report()
+
+    paths, arrays, modalities = [], [], []
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn")) as pool:
+        try:
+            exhausted = False
+            while queued or not exhausted:
+                while not exhausted and len(queued) < max_queued:
+                    path = next(pending_paths, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    queued.append((path, pool.submit(iutil.load_file_array, path, mode, min_image_bytes)))
+
+                if not queued:
+                    break
+
+                path, future = queued.popleft()
+                wait_start = time.perf_counter()
+                array, modality, error = future.result()
+                progress.decode_wait_seconds += time.perf_counter() - wait_start
+
+                if error:
+                    progress.failed += 1
+                    logger.warning(f"Skipping {path}: {error}")
+                    continue
+
+                paths.append(path)
+                arrays.append(array)
+                modalities.append(modality)
+
+                if len(paths) >= args.batch_size:
+                    await flush(paths, arrays, modalities)
+                    paths, arrays, modalities = [], [], []
+
+            await flush(paths, arrays, modalities)
+        except BrokenProcessPool:
+            # A decode worker died outright (e.g. killed for memory); keep what was decoded and stop cleanly
+            await flush(paths, arrays, modalities)
+            progress.report(force=True)
+            logger.error("A decode worker process died. Results so far are checkpointed; re-run the same command to resume.")
+            raise SystemExit(1)
+        finally:
+            writer.close()
+
+    progress.report(force=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory to walk recursively for images and .dcm files")
+    source.add_argument("--manifest", help="Text file with one image or .dcm path per line")
+
+    parser.add_argument("--model", choices=sorted(BULK_MODELS), default="custom")
+    parser.add_argument("--output", help="Write results to this NDJSON file instead of MongoDB")
+    parser.add_argument("--checkpoint", default="bulk_score.checkpoint", help="File of paths already scored")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Decode processes")
+    parser.add_argument("--username", default="bulk_score", help="Username stored on each prediction")
+    parser.add_argument("--company-id", help="Company id stored on each prediction")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress reports")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.info(f"Bulk scoring started with {args.workers} decode workers, batch size {args.batch_size}")
+    asyncio.run(score(args))
+
+
+if __name__ == "__main__":
+    main()
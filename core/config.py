@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     MODEL_BASE_LOCATION: str = os.getenv("MODEL_BASE_LOCATION", "model")
     CUSTOMCNN_MODEL: str = os.getenv("CUSTOMCNN_MODEL")
     EFFECIENTNETCNN_MODEL: str = os.getenv("EFFECIENTNETCNN_MODEL")
+    PREDICTION_THRESHOLD: float = float(os.getenv("PREDICTION_THRESHOLD", 0.5))
+
+    # Cascade: Custom CNN first, EfficientNet only when the score is within the band around the threshold
+    CASCADE_UNCERTAINTY_BAND: float = float(os.getenv("CASCADE_UNCERTAINTY_BAND", 0.15))
 
     # Security and auth
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "yourSuper!@%S3cre3tKe6y")
@@ -29,6 +33,28 @@ class Settings(BaseSettings):
     MONGO_MAX_RETRIES: int = int(os.getenv("MONGO_MAX_RETRIES", 5))
     MONGO_RETRY_DELAY: int = int(os.getenv("MONGO_RETRY_DELAY", 3))
 
+    # Prediction export
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    EXPORT_GZIP_LEVEL: int = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+    COMPLIANCE_ROLE: str = os.getenv("COMPLIANCE_ROLE", "compliance")
+
+    # WebSocket streaming classification
+    WS_MAX_IN_FLIGHT: int = int(os.getenv("WS_MAX_IN_FLIGHT", 8))
+    WS_PERSIST_BATCH_SIZE: int = int(os.getenv("WS_PERSIST_BATCH_SIZE", 50))
+    WS_PERSIST_INTERVAL_SECONDS: float = float(os.getenv("WS_PERSIST_INTERVAL_SECONDS", 2))
+    WS_PERSIST_RETRIES: int = int(os.getenv("WS_PERSIST_RETRIES", 3))
+    WS_PERSIST_RETRY_DELAY_SECONDS: float = float(os.getenv("WS_PERSIST_RETRY_DELAY_SECONDS", 1))
+    WS_MAX_FRAME_MB: int = int(os.getenv("WS_MAX_FRAME_MB", 10))
+    WS_AUTH_TIMEOUT_SECONDS: int = int(os.getenv("WS_AUTH_TIMEOUT_SECONDS", 10))
+
+    # Profiling (admin only, off unless enabled here or at runtime)
+    ADMIN_ROLE: str = os.getenv("ADMIN_ROLE", "admin")
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "profiles")
+    PROFILING_MAX_SECONDS: int = int(os.getenv("PROFILING_MAX_SECONDS", 60))
+    PROFILING_MAX_ARTIFACTS: int = int(os.getenv("PROFILING_MAX_ARTIFACTS", 20))
+    PROFILING_MAX_ARTIFACT_MB: int = int(os.getenv("PROFILING_MAX_ARTIFACT_MB", 500))
+
     # App Info
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     ENV: str = os.getenv("ENV", "development")
@@ -1,8 +1,22 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import UpdateOne
 from core.database import db
 
+# Fields returned by the export cursor, keeps documents small on the wire
+EXPORT_PROJECTION = {
+    "_id": 1,
+    "username": 1,
+    "company_id": 1,
+    "metadata": 1,
+    "prediction": 1,
+    "confidence": 1,
+    "model_version": 1,
+    "timestamp": 1,
+}
+
 class CancerInput(BaseModel):
     cnn_model_type: str
     prediction: str
@@ -11,6 +25,10 @@ class CancerInput(BaseModel):
     cnn_model_version: str
     timestamp: str
 
+class CascadeInput(CancerInput):
+    cascade_stages: List[str]
+    escalated: bool
+
 class CancerRecord(BaseModel):
     id: Optional[str]
     username: str
@@ -31,6 +49,22 @@ class CancerRecord(BaseModel):
         company_id: Optional[str] = None
         ) -> str:
 
+        record = CancerRecord.build_record(metadata, username, prediction, confidence, cnn_model_version, company_id)
+
+        result = await db["image_predictions"].insert_one(record)
+        
+        return str(result.inserted_id)
+
+    @staticmethod
+    def build_record(
+        metadata: Dict[str, Any], 
+        username: str, 
+        prediction: str, 
+        confidence: float, 
+        cnn_model_version: str, 
+        company_id: Optional[str] = None
+        ) -> Dict[str, Any]:
+
         record = {
             "username": username,
             "metadata": metadata,
@@ -43,9 +77,47 @@ class CancerRecord(BaseModel):
         if company_id:
             record["company_id"] = company_id
 
-        result = await db["image_predictions"].insert_one(record)
-        
-        return str(result.inserted_id)
+        return record
+
+    @staticmethod
+    async def create_cancer_predictions(records: List[Dict[str, Any]]) -> List[str]:
+        """
+        Bulk inserts records built with build_record in a single round trip.
+        Unordered so one bad document does not block the rest of the batch.
+        """
+        if not records:
+            return []
+
+        result = await db["image_predictions"].insert_many(records, ordered=False)
+
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    @staticmethod
+    async def upsert_cancer_predictions_by_source(records: List[Dict[str, Any]]) -> None:
+        """
+        Bulk writes records whose metadata carries a source_path, inserting each
+        one only if that path has no prediction from the same model yet. Writing
+        the same batch twice (e.g. resuming after a crash) leaves one document per
+        path. Unordered; a partial failure raises BulkWriteError after the rest
+        of the batch is written.
+        """
+        if not records:
+            return
+
+        operations = [
+            UpdateOne(
+                {
+                    "metadata.source_path": record["metadata"]["source_path"],
+                    "metadata.model_type": record["metadata"].get("model_type"),
+                    "model_version": record["model_version"],
+                },
+                {"$setOnInsert": record},
+                upsert=True
+            )
+            for record in records
+        ]
+
+        await db["image_predictions"].bulk_write(operations, ordered=False)
 
     @staticmethod
     async def get_cancer_predictions(username: str, company_id: Optional[str] = None, limit: int = 100 ) -> List["CancerRecord"]:
@@ -70,3 +142,49 @@ class CancerRecord(BaseModel):
             records.append(record)
 
         return records
+
+    @staticmethod
+    async def stream_cancer_predictions(
+        username: str,
+        company_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after_id: Optional[ObjectId] = None,
+        batch_size: int = 1000,
+        company_wide: bool = False
+        ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields raw prediction documents in ascending _id order using a server-side cursor.
+        Scoped to the user's own predictions like get_cancer_predictions, or to every
+        prediction in the company when company_wide is set; callers must check the role.
+        Only one batch is held in memory at a time.
+
+        start/end only select the time window. after_id is the only resume token:
+        timestamps are stamped when a prediction is made while _id is assigned at
+        insert time, so bulk-inserted records do not follow timestamp order and
+        resuming from a timestamp would skip rows.
+        """
+
+        if company_wide:
+            query: Dict[str, Any] = {"company_id": company_id}
+        else:
+            query = {"username": username}
+            if company_id:
+                query["company_id"] = company_id
+
+        if start or end:
+            query["timestamp"] = {}
+            if start:
+                query["timestamp"]["$gte"] = start
+            if end:
+                query["timestamp"]["$lte"] = end
+
+        if after_id:
+            query["_id"] = {"$gt": after_id}
+
+        cursor = db["image_predictions"].find(query, EXPORT_PROJECTION, batch_size=batch_size).sort("_id", 1)
+        try:
+            async for doc in cursor:
+                yield doc
+        finally:
+            await cursor.close()
@@ -1,17 +1,20 @@
 from datetime import datetime, timezone
 import io
-from fastapi import APIRouter, File, UploadFile, HTTPException, status, Depends, Request
-from auth.dependencies import get_current_user
+import time
+from typing import Optional
+from fastapi import APIRouter, File, UploadFile, HTTPException, status, Depends, Request, Header
+from auth.dependencies import get_current_user_context, require_admin
 from core.config import settings
 from fastapi.security import OAuth2PasswordBearer
-from entity.cancer_model import CancerInput, CancerRecord
+from entity.cancer_model import CancerInput, CascadeInput, CancerRecord
 # from tensorflow.keras.models import load_model  # type: ignore
 from PIL import Image
 import numpy as np
-import pydicom
 from utils.logging_config import setup_logger
 from core.config import settings
 import utils.model_utils as mutil
+import utils.image_utils as iutil
+from utils.cascade import cascade_stats, should_escalate
 
 logger = setup_logger(__name__)
 
@@ -23,7 +26,7 @@ oauth2_scheme = OAuth2PasswordBearer(settings.TOKEN_URL)
 model_version = settings.MODEL_VERSION
 
 @router.post("/classify", response_model=CancerInput)
-async def predict(request: Request, file: UploadFile = File(...), user=Depends(get_current_user)):
+async def predict(request: Request, file: UploadFile = File(...), user=Depends(get_current_user_context)):
 
     model = request.app.state.custom_model
 
@@ -35,21 +38,12 @@ async def predict(request: Request, file: UploadFile = File(...), user=Depends(g
     
         image_data = await file.read()
 
-        image = Image.open(io.BytesIO(image_data)).convert("L")  # Convert to grayscale
-
-        if image.size != (512, 512):
-            logger.warning(f"Resizing image from {image.size} to (512, 512)")
-            image = image.resize((512, 512))
-
-        if file.size is not None and file.size < 10240:  # 10 KB
-            raise HTTPException(status_code=400, detail="Image file too small to be valid.")
+        # Grayscale 512x512, rejecting uploads under 10 KB before decoding
+        pixels = iutil.decode_image_bytes(image_data, "L", min_bytes=iutil.MIN_IMAGE_BYTES)
 
+        pred = model.predict(iutil.tensor_to_batch(pixels, model.input_shape))[0]  # (1, 1)
 
-        processed = np.asarray(image) / 255.0  # Normalize image to [0, 1]
-        processed = np.expand_dims(processed, axis=-1)  # (512, 512, 1)
-        pred = model.predict(np.expand_dims(processed, axis=0))[0]  # (1, 1)
-
-        label = "cancer" if pred[0] > 0.5 else "not_cancer"
+        label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
         confidence = round(float(pred[0]), 3)
 
         logger.info(f"User={user['username']} | IP={request.client.host} | DICOM={file.filename} | Prediction={label}, Confidence={confidence}")
@@ -84,7 +78,7 @@ async def predict(request: Request, file: UploadFile = File(...), user=Depends(g
 
 
 @router.post("/classify/dcm")
-async def predict_from_dicom(request: Request, file: UploadFile = File(...), user=Depends(get_current_user)):
+async def predict_from_dicom(request: Request, file: UploadFile = File(...), user=Depends(get_current_user_context)):
 
     model = request.app.state.custom_model
 
@@ -94,30 +88,17 @@ async def predict_from_dicom(request: Request, file: UploadFile = File(...), use
     try:
         # Read the DICOM file
         dcm_bytes = await file.read()
-        ds = pydicom.dcmread(io.BytesIO(dcm_bytes))
-
-         # Validate modality
-        modality = getattr(ds, "Modality", None)
-        if modality != "MR":
-            logger.warning(f"Rejected DICOM with unsupported Modality: {modality}")
-            raise HTTPException(status_code=400, detail="Only MR modality DICOMs are supported.")
+        ds = iutil.read_dicom(dcm_bytes)
 
-        # Extract pixel array and convert to PIL image
-        pixel_array = ds.pixel_array.astype(np.float32)
-        pixel_array -= pixel_array.min()
-        pixel_array /= pixel_array.max() if pixel_array.max() != 0 else 1
+        # Validate modality before decoding any pixel data
+        modality = iutil.check_dicom_modality(ds)
 
-        image = Image.fromarray((pixel_array * 255).astype(np.uint8)).convert("L")
+        # Convert pixels to a 512x512 grayscale array
+        pixels = iutil.dicom_to_array(ds, "L")
 
-        if image.size != (512, 512):
-            logger.warning(f"Resizing DICOM image from {image.size} to (512, 512)")
-            image = image.resize((512, 512))
+        pred = model.predict(iutil.tensor_to_batch(pixels, model.input_shape))[0]
 
-        processed = np.asarray(image) / 255.0
-        processed = np.expand_dims(processed, axis=-1)
-        pred = model.predict(np.expand_dims(processed, axis=0))[0]
-
-        label = "cancer" if pred[0] > 0.5 else "not_cancer"
+        label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
         confidence = round(float(pred[0]), 3)
 
         logger.info(f"User={user['username']} | IP={request.client.host} | DICOM={file.filename} | Prediction={label}, Confidence={confidence}")
@@ -151,7 +132,7 @@ async def predict_from_dicom(request: Request, file: UploadFile = File(...), use
 
 
 @router.post("/classify/rgb", response_model=CancerInput)
-async def predict_rgb(request: Request, file: UploadFile = File(...), user=Depends(get_current_user)):
+async def predict_rgb(request: Request, file: UploadFile = File(...), user=Depends(get_current_user_context)):
 
     eNetTLearningModel = request.app.state.efficientnet_model
 
@@ -160,17 +141,10 @@ async def predict_rgb(request: Request, file: UploadFile = File(...), user=Depen
 
     try:
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")  # Convert to 3-channel RGB
-
-        if image.size != (512, 512):
-            logger.warning(f"Resizing image from {image.size} to (512, 512)")
-            image = image.resize((512, 512))
-
-        processed = np.asarray(image) / 255.0  # Normalize
-        processed = np.expand_dims(processed, axis=0)  # shape (1, 512, 512, 3)
+        pixels = iutil.decode_image_bytes(image_data, "RGB")  # 3-channel RGB, 512x512
 
-        pred = eNetTLearningModel.predict(processed)[0]
-        label = "cancer" if pred[0] > 0.5 else "not_cancer"
+        pred = eNetTLearningModel.predict(iutil.tensor_to_batch(pixels, eNetTLearningModel.input_shape))[0]
+        label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
         confidence = round(float(pred[0]), 3)
 
         logger.info(f"User={user['username']} | IP={request.client.host} | File={file.filename} | Prediction={label}, Confidence={confidence}")
@@ -203,8 +177,236 @@ async def predict_rgb(request: Request, file: UploadFile = File(...), user=Depen
         raise HTTPException(status_code=500, detail="Prediction failed")
 
 
+@router.post("/classify/cascade", response_model=CascadeInput)
+async def predict_cascade(request: Request, file: UploadFile = File(...), user=Depends(get_current_user_context)):
+
+    model = request.app.state.custom_model
+    eNetTLearningModel = request.app.state.efficientnet_model
+
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    try:
+        image_data = await file.read()
+        image = Image.open(io.BytesIO(image_data)).convert("RGB")
+
+        if image.size != (512, 512):
+            logger.warning(f"Resizing image from {image.size} to (512, 512)")
+            image = image.resize((512, 512))
+
+        # Stage 1: Custom CNN on the grayscale version of the same image
+        stage1_start = time.perf_counter()
+        pred = model.predict(iutil.tensor_to_batch(np.asarray(image.convert("L")), model.input_shape))[0]
+        stage1_seconds = time.perf_counter() - stage1_start
+
+        stage1_score = float(pred[0])
+        stages = ["Custom CNN"]
+        stage_scores = {"Custom CNN": round(stage1_score, 3)}
+        score = stage1_score
+
+        escalated = should_escalate(stage1_score)
+        if escalated:
+            # Stage 2: EfficientNet only when stage 1 is inside the uncertainty band
+            stage2_start = time.perf_counter()
+            pred = eNetTLearningModel.predict(np.expand_dims(np.asarray(image) / 255.0, axis=0))[0]
+            stage2_seconds = time.perf_counter() - stage2_start
+
+            score = float(pred[0])
+            stages.append("EfficientNetB0")
+            stage_scores["EfficientNetB0"] = round(score, 3)
+            cascade_stats.record(stage1_score, stage1_seconds, score, stage2_seconds)
+        else:
+            cascade_stats.record(stage1_score, stage1_seconds)
+
+        label = "cancer" if score > settings.PREDICTION_THRESHOLD else "not_cancer"
+        confidence = round(score, 3)
+
+        logger.info(f"User={user['username']} | IP={request.client.host} | File={file.filename} | Stages={stages} | Prediction={label}, Confidence={confidence}")
+
+        await CancerRecord.create_cancer_prediction(
+            metadata={
+                "filename": file.filename,
+                "model_type": stages[-1],
+                "cascade_stages": stages,
+                "stage_scores": stage_scores,
+                "uncertainty_band": settings.CASCADE_UNCERTAINTY_BAND
+                },
+            username=user["username"],
+            prediction=label,
+            confidence=confidence,
+            cnn_model_version=model_version,
+            company_id=user.get("company_id")
+        )
+
+        return {
+            "cnn_model_type": stages[-1],
+            "prediction": label,
+            "confidence": confidence,
+            "filename": file.filename,
+            "cnn_model_version": model_version,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "cascade_stages": stages,
+            "escalated": escalated
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Cascade prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Prediction failed")
+
+
+@router.get("/classify/cascade/stats")
+def get_cascade_stats(user=Depends(require_admin)):
+
+    logger.info("/classify/cascade/stats accessed")
+
+    return cascade_stats.as_dict()
+
+
+@router.delete("/classify/cascade/stats")
+def reset_cascade_stats(user=Depends(require_admin)):
+
+    # Start a fresh window after changing CASCADE_UNCERTAINTY_BAND so old and new bands are not mixed
+    cascade_stats.reset()
+    logger.info(f"User={user['username']} reset cascade stats")
+
+    return cascade_stats.as_dict()
+
+
+async def read_tensor(request: Request, model, shape_header: Optional[str], dtype_header: Optional[str]) -> np.ndarray:
+    """
+    Reads a raw tensor body (.npy or headerless uint8) and returns a model-ready batch.
+    The body is mapped with np.frombuffer, skipping the PIL decode entirely.
+    """
+    content_type = (request.headers.get("content-type") or "").split(";")[0].strip()
+    if content_type not in (iutil.NPY_CONTENT_TYPE, iutil.RAW_CONTENT_TYPE):
+        raise HTTPException(
+            status_code=415,
+            detail=f"Tensor uploads must be {iutil.NPY_CONTENT_TYPE} or {iutil.RAW_CONTENT_TYPE}"
+        )
+
+    max_bytes = iutil.expected_tensor_bytes(model.input_shape)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Tensor payload exceeds {max_bytes} bytes")
+
+    # Content-Length is absent on chunked uploads, so enforce the cap while reading too.
+    # np.frombuffer maps the bytearray directly, so this is still the only copy of the body.
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Tensor payload exceeds {max_bytes} bytes")
+
+    if content_type == iutil.NPY_CONTENT_TYPE:
+        array = iutil.decode_npy(body)
+    else:
+        array = iutil.decode_raw_tensor(body, shape_header, dtype_header)
+
+    return iutil.tensor_to_batch(array, model.input_shape)
+
+
+@router.post("/classify/tensor", response_model=CancerInput)
+async def predict_from_tensor(
+    request: Request,
+    shape_header: Optional[str] = Header(None, alias="X-Tensor-Shape"),
+    dtype_header: Optional[str] = Header(None, alias="X-Tensor-Dtype"),
+    filename: str = Header("tensor", alias="X-Filename"),
+    user=Depends(get_current_user_context)
+):
+
+    model = request.app.state.custom_model
+
+    try:
+        processed = await read_tensor(request, model, shape_header, dtype_header)
+        pred = model.predict(processed)[0]
+
+        label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
+        confidence = round(float(pred[0]), 3)
+
+        logger.info(f"User={user['username']} | IP={request.client.host} | Tensor={filename} | Prediction={label}, Confidence={confidence}")
+
+        await CancerRecord.create_cancer_prediction(
+            metadata={
+                "filename": filename,
+                "model_type": "Custom CNN",
+                "input_format": "tensor"
+                },
+            username=user["username"],
+            prediction=label,
+            confidence=confidence,
+            cnn_model_version=model_version,
+            company_id=user.get("company_id")
+        )
+
+        return {
+            "cnn_model_type": "Custom CNN",
+            "prediction": label,
+            "confidence": confidence,
+            "filename": filename,
+            "cnn_model_version": model_version,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Tensor prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Prediction failed")
+
+
+@router.post("/classify/rgb/tensor", response_model=CancerInput)
+async def predict_rgb_from_tensor(
+    request: Request,
+    shape_header: Optional[str] = Header(None, alias="X-Tensor-Shape"),
+    dtype_header: Optional[str] = Header(None, alias="X-Tensor-Dtype"),
+    filename: str = Header("tensor", alias="X-Filename"),
+    user=Depends(get_current_user_context)
+):
+
+    eNetTLearningModel = request.app.state.efficientnet_model
+
+    try:
+        processed = await read_tensor(request, eNetTLearningModel, shape_header, dtype_header)
+        pred = eNetTLearningModel.predict(processed)[0]
+
+        label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
+        confidence = round(float(pred[0]), 3)
+
+        logger.info(f"User={user['username']} | IP={request.client.host} | Tensor={filename} | Prediction={label}, Confidence={confidence}")
+
+        await CancerRecord.create_cancer_prediction(
+            metadata={
+                "filename": filename,
+                "model_type": "EfficientNetB0",
+                "input_format": "tensor"
+                },
+            username=user["username"],
+            prediction=label,
+            confidence=confidence,
+            cnn_model_version=model_version,
+            company_id=user.get("company_id")
+        )
+
+        return {
+            "cnn_model_type": "EfficientNetB0",
+            "prediction": label,
+            "confidence": confidence,
+            "filename": filename,
+            "cnn_model_version": model_version,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"RGB tensor prediction error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Prediction failed")
+
+
 @router.get("/metatlearningenet")
-def get_model_meta_tlearning_enetB0(request: Request, user=Depends(get_current_user)):
+def get_model_meta_tlearning_enetB0(request: Request, user=Depends(get_current_user_context)):
 
     eNetTLearningModel = request.app.state.efficientnet_model
 
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse
+from auth.dependencies import get_current_user_context, has_role
+from entity.cancer_model import CancerRecord
+from utils.logging_config import setup_logger
+from core.config import settings
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_COLUMNS = [
+    "id", "username", "company_id", "prediction", "confidence",
+    "model_version", "timestamp", "filename", "model_type", "modality",
+]
+
+# Compressed output is buffered until it reaches this size before being sent
+GZIP_CHUNK_BYTES = 64 * 1024
+
+
+def to_export_row(doc: dict) -> dict:
+    # Flat CSV row; only the metadata fields common to every record get a column
+    metadata = doc.get("metadata") or {}
+    timestamp = doc.get("timestamp")
+
+    return {
+        "id": str(doc["_id"]),
+        "username": doc.get("username"),
+        "company_id": doc.get("company_id"),
+        "prediction": doc.get("prediction"),
+        "confidence": doc.get("confidence"),
+        "model_version": doc.get("model_version"),
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "filename": metadata.get("filename"),
+        "model_type": metadata.get("model_type"),
+        "modality": metadata.get("modality"),
+    }
+
+
+def to_export_document(doc: dict) -> dict:
+    # NDJSON keeps the full metadata object (cascade stages, frame ids, source paths, ...)
+    timestamp = doc.get("timestamp")
+
+    return {
+        "id": str(doc["_id"]),
+        "username": doc.get("username"),
+        "company_id": doc.get("company_id"),
+        "prediction": doc.get("prediction"),
+        "confidence": doc.get("confidence"),
+        "model_version": doc.get("model_version"),
+        "timestamp": timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        "metadata": doc.get("metadata") or {},
+    }
+
+
+async def encode_rows(docs, export_format: str):
+    # Close the cursor generator ourselves when the client disconnects, rather than leaving it to GC
+    try:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            yield buffer.getvalue().encode("utf-8")
+
+            async for doc in docs:
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerow(to_export_row(doc))
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            async for doc in docs:
+                yield (json.dumps(to_export_document(doc), default=str) + "\n").encode("utf-8")
+    finally:
+        await docs.aclose()
+
+
+async def gzip_stream(chunks):
+    # wbits=16+MAX_WBITS writes a gzip header/trailer instead of a raw zlib stream
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = bytearray()
+
+    try:
+        async for chunk in chunks:
+            pending += compressor.compress(chunk)
+            if len(pending) >= GZIP_CHUNK_BYTES:
+                yield bytes(pending)
+                pending.clear()
+
+        pending += compressor.flush()
+        yield bytes(pending)
+    finally:
+        await chunks.aclose()
+
+
+@router.get("/predictions/export")
+async def export_predictions(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Only records at or after this timestamp"),
+    until: Optional[datetime] = Query(None, description="Only records at or before this timestamp"),
+    after_id: Optional[str] = Query(None, description="Resume token: the id of the last record received"),
+    scope: str = Query("user", pattern="^(user|company)$", description="company requires the compliance or admin role"),
+    user=Depends(get_current_user_context)
+):
+
+    try:
+        resume_id = ObjectId(after_id) if after_id else None
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="after_id is not a valid record id")
+
+    company_id = user.get("company_id")
+    company_wide = scope == "company"
+
+    if company_wide:
+        if not (has_role(user, settings.COMPLIANCE_ROLE) or has_role(user, settings.ADMIN_ROLE)):
+            logger.warning(f"User={user['username']} attempted a company-wide export without the compliance role")
+            raise HTTPException(status_code=403, detail="Company-wide export requires the compliance role")
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Company-wide export requires a user with a company")
+
+    logger.info(
+        f"User={user['username']} | IP={request.client.host} | Export format={format} | Scope={scope} | "
+        f"Company={company_id} | Since={since} | Until={until} | AfterId={after_id}"
+    )
+
+    docs = CancerRecord.stream_cancer_predictions(
+        username=user["username"],
+        company_id=company_id,
+        start=since,
+        end=until,
+        after_id=resume_id,
+        batch_size=settings.EXPORT_BATCH_SIZE,
+        company_wide=company_wide
+    )
+
+    body = encode_rows(docs, format)
+    headers = {"Content-Disposition": f'attachment; filename="predictions.{format}"'}
+
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
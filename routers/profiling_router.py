@@ -0,0 +1,152 @@
+import asyncio
+import os
+import threading
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from auth.dependencies import require_admin
+from utils.logging_config import setup_logger
+from core.config import settings
+import utils.profiling as prof
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+# Per worker process: with several uvicorn workers each one is toggled and profiled separately
+profiling_state = {"enabled": settings.PROFILING_ENABLED}
+
+# Only one capture at a time; tracemalloc and the TF profiler are process-global
+capture_lock = asyncio.Lock()
+
+PROFILED_MODELS = {
+    "custom": "custom_model",
+    "rgb": "efficientnet_model",
+}
+
+
+def require_profiling_enabled(user=Depends(require_admin)) -> dict:
+    # Resolved after require_admin so unauthenticated callers cannot probe whether profiling is on
+    if not profiling_state["enabled"]:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return user
+
+
+def acquire_capture():
+    if capture_lock.locked():
+        raise HTTPException(status_code=409, detail="Another profiling capture is already running")
+
+
+def artifact_names(paths) -> list:
+    return [os.path.basename(path) for path in paths]
+
+
+@router.get("/admin/profiling")
+async def get_profiling_status(user=Depends(require_admin)):
+    return {
+        "enabled": profiling_state["enabled"],
+        "capturing": capture_lock.locked(),
+        "max_seconds": settings.PROFILING_MAX_SECONDS,
+        "max_artifacts": settings.PROFILING_MAX_ARTIFACTS,
+        "max_artifact_mb": settings.PROFILING_MAX_ARTIFACT_MB,
+        "artifacts": prof.list_artifacts(),
+    }
+
+
+@router.put("/admin/profiling")
+async def set_profiling_enabled(enabled: bool = Query(...), user=Depends(require_admin)):
+    profiling_state["enabled"] = enabled
+    logger.info(f"User={user['username']} set profiling enabled={enabled}")
+    return {"enabled": enabled}
+
+
+@router.post("/admin/profiling/cpu")
+async def capture_cpu_profile(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    user=Depends(require_profiling_enabled)
+):
+    seconds = min(seconds, settings.PROFILING_MAX_SECONDS)
+    acquire_capture()
+
+    async with capture_lock:
+        logger.info(f"User={user['username']} started CPU profile for {seconds}s at {interval_ms}ms")
+
+        # This handler runs on the event loop thread, so its id labels loop samples
+        sampler = prof.CpuSampler(interval_ms / 1000, threading.get_ident())
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await run_in_threadpool(sampler.stop)
+
+        path = prof.artifact_base("cpu") + ".collapsed"
+        await run_in_threadpool(sampler.write, path)
+        await run_in_threadpool(prof.prune_artifacts, [path])
+
+    return {"samples": sampler.samples, "seconds": seconds, "artifacts": artifact_names([path])}
+
+
+@router.post("/admin/profiling/memory")
+async def capture_allocation_snapshot(
+    seconds: float = Query(10, gt=0),
+    top: int = Query(25, ge=1, le=500),
+    user=Depends(require_profiling_enabled)
+):
+    seconds = min(seconds, settings.PROFILING_MAX_SECONDS)
+    acquire_capture()
+
+    async with capture_lock:
+        logger.info(f"User={user['username']} started allocation trace for {seconds}s")
+
+        tracer = prof.AllocationTracer()
+        await run_in_threadpool(tracer.start)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            paths = await run_in_threadpool(tracer.stop, prof.artifact_base("alloc"), top)
+        await run_in_threadpool(prof.prune_artifacts, paths)
+
+    return {"seconds": seconds, "artifacts": artifact_names(paths)}
+
+
+@router.post("/admin/profiling/tensorflow")
+async def capture_tf_trace(
+    request: Request,
+    seconds: float = Query(5, gt=0),
+    model: str = Query("custom", pattern="^(custom|rgb)$"),
+    synthetic: bool = Query(False, description="Drive model.predict with a blank batch during the window"),
+    user=Depends(require_profiling_enabled)
+):
+    seconds = min(seconds, settings.PROFILING_MAX_SECONDS)
+    acquire_capture()
+
+    async with capture_lock:
+        logger.info(f"User={user['username']} started TensorFlow trace for {seconds}s (model={model}, synthetic={synthetic})")
+
+        logdir = prof.artifact_base("tf")
+        await run_in_threadpool(prof.start_tf_trace, logdir)
+        try:
+            if synthetic:
+                await run_in_threadpool(prof.predict_for, getattr(request.app.state, PROFILED_MODELS[model]), seconds)
+            else:
+                await asyncio.sleep(seconds)
+        finally:
+            archive = await run_in_threadpool(prof.stop_tf_trace, logdir)
+        await run_in_threadpool(prof.prune_artifacts, [archive])
+
+    return {"seconds": seconds, "artifacts": artifact_names([archive])}
+
+
+@router.get("/admin/profiling/artifacts/{name}")
+async def download_artifact(name: str, user=Depends(require_admin)):
+    path = prof.resolve_artifact(name)
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
+
+@router.delete("/admin/profiling/artifacts/{name}")
+async def delete_artifact(name: str, user=Depends(require_admin)):
+    path = prof.resolve_artifact(name)
+    os.remove(path)
+    logger.info(f"User={user['username']} deleted profiling artifact {name}")
+    return {"deleted": name}
@@ -0,0 +1,420 @@
+import asyncio
+import json
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Optional
+import numpy as np
+from pymongo.errors import BulkWriteError
+from fastapi import APIRouter, HTTPException, WebSocket, status
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketState
+from auth.dependencies import get_websocket_user_context
+from entity.cancer_model import CancerRecord
+from utils.logging_config import setup_logger
+from core.config import settings
+import utils.image_utils as iutil
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+model_version = settings.MODEL_VERSION
+
+# model query parameter -> (app.state attribute, model type label, PIL mode)
+STREAM_MODELS = {
+    "custom": ("custom_model", "Custom CNN", "L"),
+    "rgb": ("efficientnet_model", "EfficientNetB0", "RGB"),
+}
+
+# Binary frames are: 4-byte big-endian header length | UTF-8 JSON header | payload
+FRAME_HEADER_PREFIX = struct.Struct(">I")
+
+MAX_FRAME_BYTES = settings.WS_MAX_FRAME_MB * 1024 * 1024
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class FrameError(Exception):
+    def __init__(self, frame_id: Optional[str], detail: str):
+        super().__init__(detail)
+        self.frame_id = frame_id
+        self.detail = detail
+
+
+def parse_frame(message: bytes):
+    if len(message) > MAX_FRAME_BYTES:
+        raise FrameError(None, f"Frame exceeds {settings.WS_MAX_FRAME_MB} MB")
+
+    if len(message) < FRAME_HEADER_PREFIX.size:
+        raise FrameError(None, "Frame is missing its header length prefix")
+
+    (header_length,) = FRAME_HEADER_PREFIX.unpack_from(message)
+    header_end = FRAME_HEADER_PREFIX.size + header_length
+
+    try:
+        header = json.loads(message[FRAME_HEADER_PREFIX.size:header_end])
+    except ValueError:
+        raise FrameError(None, "Frame header is not valid JSON")
+
+    if not isinstance(header, dict) or "frame_id" not in header:
+        raise FrameError(None, "Frame header must be an object with a frame_id")
+
+    return str(header["frame_id"]), header, memoryview(message)[header_end:]
+
+
+def decode_frame(payload: memoryview, frame_format: str, mode: str, input_shape) -> np.ndarray:
+    if frame_format == "npy":
+        array = iutil.decode_npy(payload)
+    else:
+        array = iutil.decode_image_bytes(payload, mode)
+
+    return iutil.tensor_to_batch(array, input_shape)
+
+
+class StreamMetrics:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.frames_received = 0
+        self.frames_completed = 0
+        self.frames_failed = 0
+        self.bytes_received = 0
+        self.decode_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.inference_batches = 0
+        self.backpressure_seconds = 0.0
+        self.max_in_flight = 0
+        self.records_persisted = 0
+        self.records_failed = 0
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "type": "metrics",
+            "elapsed_seconds": round(elapsed, 3),
+            "frames_received": self.frames_received,
+            "frames_completed": self.frames_completed,
+            "frames_failed": self.frames_failed,
+            "bytes_received": self.bytes_received,
+            "frames_per_second": round(self.frames_completed / elapsed, 2) if elapsed else 0.0,
+            "avg_decode_ms": round(self.decode_seconds * 1000 / max(self.frames_received, 1), 3),
+            "avg_inference_ms": round(self.inference_seconds * 1000 / max(self.inference_batches, 1), 3),
+            "avg_inference_batch": round(self.frames_completed / max(self.inference_batches, 1), 2),
+            "backpressure_seconds": round(self.backpressure_seconds, 3),
+            "max_in_flight": self.max_in_flight,
+            "records_persisted": self.records_persisted,
+            "records_failed": self.records_failed,
+        }
+
+
+class StreamSession:
+    """
+    One WebSocket connection. Frames are decoded concurrently in the threadpool
+    while the previous ones are being inferred, and at most WS_MAX_IN_FLIGHT
+    frames are held at once; when that limit is reached the socket is no longer
+    read, which pushes back on the client through TCP flow control.
+    """
+
+    def __init__(self, websocket: WebSocket, user: dict, model, model_type: str, mode: str):
+        self.websocket = websocket
+        self.user = user
+        self.model = model
+        self.model_type = model_type
+        self.mode = mode
+        self.max_in_flight = settings.WS_MAX_IN_FLIGHT
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.decoded: asyncio.Queue = asyncio.Queue()
+        self.decode_tasks = set()
+        self.pending_records = []
+        self.pending_since = time.monotonic()
+        self.persist_attempts = 0
+        self.send_lock = asyncio.Lock()
+        self.connected = True
+        self.metrics = StreamMetrics()
+
+    async def send(self, message: dict):
+        if not self.connected:
+            return
+        try:
+            async with self.send_lock:
+                await self.websocket.send_text(json.dumps(message))
+        except Exception:
+            # Client went away mid-stream; keep draining so accepted frames are persisted
+            self.connected = False
+
+    async def acquire_slot(self):
+        wait_start = time.perf_counter()
+        await self.slots.acquire()
+        self.metrics.backpressure_seconds += time.perf_counter() - wait_start
+        self.in_flight += 1
+        self.metrics.max_in_flight = max(self.metrics.max_in_flight, self.in_flight)
+
+    def release_slot(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    async def fail_frame(self, frame_id: Optional[str], detail: str):
+        self.metrics.frames_failed += 1
+        await self.send({"type": "error", "frame_id": frame_id, "detail": detail})
+
+    async def decode(self, frame_id: str, header: dict, payload: memoryview):
+        try:
+            decode_start = time.perf_counter()
+            batch = await run_in_threadpool(
+                decode_frame, payload, header.get("format", "image"), self.mode, self.model.input_shape
+            )
+            self.metrics.decode_seconds += time.perf_counter() - decode_start
+        except HTTPException as e:
+            await self.fail_frame(frame_id, e.detail)
+            self.release_slot()
+            return
+        except Exception as e:
+            logger.error(f"Stream decode error for frame {frame_id}: {str(e)}")
+            await self.fail_frame(frame_id, "Failed to decode frame")
+            self.release_slot()
+            return
+
+        await self.decoded.put((frame_id, header, batch))
+
+    def persist_deadline_timeout(self) -> Optional[float]:
+        if not self.pending_records:
+            return None
+        return max(0.0, self.pending_since + settings.WS_PERSIST_INTERVAL_SECONDS - time.monotonic())
+
+    async def infer(self):
+        while True:
+            # Wake up to persist a slow feed's results even when no new frame arrives
+            try:
+                item = await asyncio.wait_for(self.decoded.get(), self.persist_deadline_timeout())
+            except asyncio.TimeoutError:
+                await self.flush_records()
+                continue
+
+            if item is None:
+                break
+
+            # Micro-batch whatever else has finished decoding in the meantime
+            items = [item]
+            stop = False
+            while not self.decoded.empty():
+                extra = self.decoded.get_nowait()
+                if extra is None:
+                    stop = True
+                    break
+                items.append(extra)
+
+            await self.predict_batch(items)
+
+            if len(self.pending_records) >= settings.WS_PERSIST_BATCH_SIZE or self.persist_deadline_timeout() == 0:
+                await self.flush_records()
+
+            if stop:
+                break
+
+    async def predict_batch(self, items):
+        try:
+            inference_start = time.perf_counter()
+            preds = await run_in_threadpool(self.model.predict, np.concatenate([batch for _, _, batch in items]))
+            self.metrics.inference_seconds += time.perf_counter() - inference_start
+            self.metrics.inference_batches += 1
+        except Exception as e:
+            logger.error(f"Stream inference error: {str(e)}")
+            for frame_id, _, _ in items:
+                await self.fail_frame(frame_id, "Prediction failed")
+                self.release_slot()
+            return
+
+        for (frame_id, header, _), pred in zip(items, preds):
+            label = "cancer" if pred[0] > settings.PREDICTION_THRESHOLD else "not_cancer"
+            confidence = round(float(pred[0]), 3)
+            filename = header.get("filename", frame_id)
+
+            if not self.pending_records:
+                self.pending_since = time.monotonic()
+            self.pending_records.append(CancerRecord.build_record(
+                metadata={
+                    "filename": filename,
+                    "model_type": self.model_type,
+                    "input_format": "stream",
+                    "frame_id": frame_id
+                    },
+                username=self.user["username"],
+                prediction=label,
+                confidence=confidence,
+                cnn_model_version=model_version,
+                company_id=self.user.get("company_id")
+            ))
+
+            self.metrics.frames_completed += 1
+            await self.send({
+                "type": "result",
+                "frame_id": frame_id,
+                "cnn_model_type": self.model_type,
+                "prediction": label,
+                "confidence": confidence,
+                "filename": filename,
+                "cnn_model_version": model_version,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            })
+            self.release_slot()
+
+    async def flush_records(self):
+        """
+        Bulk inserts the pending records. Failed records are kept and retried on
+        the next flush, up to WS_PERSIST_RETRIES attempts. Retrying is safe
+        because insert_many assigns each record its _id on the first attempt, so
+        rows that already landed come back as duplicate-key errors and are skipped.
+        Records that still fail are logged in full and reported to the client.
+        """
+        records, self.pending_records = self.pending_records, []
+        if not records:
+            return
+
+        try:
+            await CancerRecord.create_cancer_predictions(records)
+            self.metrics.records_persisted += len(records)
+            self.persist_attempts = 0
+            return
+        except BulkWriteError as e:
+            self.metrics.records_persisted += e.details.get("nInserted", 0)
+            failed_indexes = {
+                error["index"] for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY_ERROR
+            }
+            failed = [record for index, record in enumerate(records) if index in failed_indexes]
+            detail = str(e.details.get("writeErrors", [])[:1])
+        except Exception as e:
+            failed = records
+            detail = str(e)
+
+        if not failed:
+            self.persist_attempts = 0
+            return
+
+        self.persist_attempts += 1
+        logger.warning(
+            f"Failed to persist {len(failed)} streamed predictions "
+            f"(attempt {self.persist_attempts}/{settings.WS_PERSIST_RETRIES}): {detail}"
+        )
+
+        if self.persist_attempts < settings.WS_PERSIST_RETRIES:
+            self.pending_records = failed + self.pending_records
+            self.pending_since = time.monotonic()
+            return
+
+        self.persist_attempts = 0
+        self.metrics.records_failed += len(failed)
+        logger.error(f"Dropping {len(failed)} streamed predictions after retries: {json.dumps(failed, default=str)}")
+        await self.send({
+            "type": "persist_error",
+            "frame_ids": [record["metadata"]["frame_id"] for record in failed],
+            "detail": "Predictions were returned but could not be saved"
+        })
+
+    async def drain_records(self):
+        # On close keep retrying until everything is saved or the retries are used up
+        while self.pending_records:
+            await self.flush_records()
+            if self.pending_records:
+                await asyncio.sleep(settings.WS_PERSIST_RETRY_DELAY_SECONDS)
+
+    async def handle_control(self, text: str) -> bool:
+        """
+        Handles a text control message. Returns True when the client asked to close.
+        """
+        try:
+            message_type = json.loads(text).get("type")
+        except (ValueError, AttributeError):
+            await self.fail_frame(None, "Control messages must be JSON objects")
+            return False
+
+        if message_type == "metrics":
+            await self.send(self.metrics.as_dict())
+            return False
+        if message_type == "close":
+            return True
+
+        await self.fail_frame(None, f"Unknown control message type: {message_type}")
+        return False
+
+    async def run(self):
+        inference_task = asyncio.create_task(self.infer())
+
+        try:
+            while True:
+                await self.acquire_slot()
+                message = await self.websocket.receive()
+
+                if message["type"] == "websocket.disconnect":
+                    self.connected = False
+                    self.release_slot()
+                    break
+
+                if message.get("text") is not None:
+                    self.release_slot()
+                    if await self.handle_control(message["text"]):
+                        break
+                    continue
+
+                data = message.get("bytes") or b""
+                self.metrics.frames_received += 1
+                self.metrics.bytes_received += len(data)
+
+                try:
+                    frame_id, header, payload = parse_frame(data)
+                except FrameError as e:
+                    await self.fail_frame(e.frame_id, e.detail)
+                    self.release_slot()
+                    continue
+
+                task = asyncio.create_task(self.decode(frame_id, header, payload))
+                self.decode_tasks.add(task)
+                task.add_done_callback(self.decode_tasks.discard)
+        finally:
+            # Drain: finish every accepted frame, then persist what is left
+            if self.decode_tasks:
+                await asyncio.gather(*self.decode_tasks, return_exceptions=True)
+            await self.decoded.put(None)
+            await inference_task
+            await self.drain_records()
+
+        metrics = self.metrics.as_dict()
+        logger.info(f"User={self.user['username']} | Stream closed | Metrics={metrics}")
+        await self.send(metrics)
+
+
+@router.websocket("/classify/stream")
+async def classify_stream(websocket: WebSocket, model: str = "custom"):
+
+    if model not in STREAM_MODELS:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=f"Unknown model: {model}")
+        return
+
+    try:
+        user = await get_websocket_user_context(websocket)
+    except HTTPException as e:
+        logger.warning(f"Rejected websocket connection: {e.detail}")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+        return
+
+    state_attr, model_type, mode = STREAM_MODELS[model]
+
+    # Already accepted when the token arrived as the first message instead of a header
+    if websocket.application_state == WebSocketState.CONNECTING:
+        await websocket.accept()
+    logger.info(f"User={user['username']} | IP={websocket.client.host} | Stream opened | Model={model_type}")
+
+    session = StreamSession(websocket, user, getattr(websocket.app.state, state_attr), model_type, mode)
+
+    try:
+        await session.run()
+    except Exception as e:
+        logger.exception(f"Stream error: {str(e)}")
+        session.connected = False
+
+    if session.connected:
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass
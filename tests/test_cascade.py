@@ -0,0 +1,30 @@
+from utils.cascade import CascadeStats
+
+
+def test_as_dict_latency_saved_charges_stage1_on_every_request():
+    stats = CascadeStats()
+
+    # Three requests settle at stage 1 (10 ms each); one escalates and pays 100 ms at stage 2
+    stats.record(0.05, 0.010)
+    stats.record(0.10, 0.010)
+    stats.record(0.95, 0.010)
+    stats.record(0.48, 0.010, stage2_score=0.70, stage2_seconds=0.100)
+
+    result = stats.as_dict()
+
+    assert result["requests"] == 4
+    assert result["escalations"] == 1
+    assert result["escalation_rate"] == 0.25
+    assert result["escalation_label_flip_rate"] == 1.0
+    assert result["avg_stage1_ms"] == 10.0
+    assert result["avg_stage2_ms"] == 100.0
+    # 3 settled * 100 ms skipped - 4 requests * 10 ms of stage 1 overhead
+    assert result["estimated_latency_saved_ms"] == 260.0
+
+
+def test_as_dict_is_zero_without_requests():
+    result = CascadeStats().as_dict()
+
+    assert result["requests"] == 0
+    assert result["escalation_rate"] == 0.0
+    assert result["estimated_latency_saved_ms"] == 0.0
@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from core.config import settings
+
+# Width of the first-stage score histogram buckets used for tuning the band
+SCORE_BUCKET_WIDTH = 0.05
+
+
+def should_escalate(score: float, band: Optional[float] = None) -> bool:
+    """
+    True when the first-stage score is too close to the decision threshold to trust.
+    """
+    band = settings.CASCADE_UNCERTAINTY_BAND if band is None else band
+    return abs(score - settings.PREDICTION_THRESHOLD) <= band
+
+
+class CascadeStats:
+    """
+    Per-process counters for the cascade endpoint. Latency saved is measured
+    against running the second stage on every request: each settled request
+    skips one average second-stage call, while every request (settled or
+    escalated) pays for one first-stage call that the baseline would not run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.escalations = 0
+            self.label_flips = 0
+            self.stage1_seconds = 0.0
+            self.stage2_seconds = 0.0
+            self.score_buckets = [0] * int(round(1 / SCORE_BUCKET_WIDTH))
+            self.started_at = datetime.now(timezone.utc)
+
+    def record(self, stage1_score: float, stage1_seconds: float, stage2_score: Optional[float] = None, stage2_seconds: float = 0.0):
+        with self._lock:
+            self.requests += 1
+            self.stage1_seconds += stage1_seconds
+
+            bucket = min(int(stage1_score / SCORE_BUCKET_WIDTH), len(self.score_buckets) - 1)
+            self.score_buckets[max(bucket, 0)] += 1
+
+            if stage2_score is not None:
+                self.escalations += 1
+                self.stage2_seconds += stage2_seconds
+
+                threshold = settings.PREDICTION_THRESHOLD
+                if (stage1_score > threshold) != (stage2_score > threshold):
+                    self.label_flips += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            avg_stage1_ms = self.stage1_seconds * 1000 / self.requests if self.requests else 0.0
+            avg_stage2_ms = self.stage2_seconds * 1000 / self.escalations if self.escalations else 0.0
+            settled = self.requests - self.escalations
+
+            return {
+                "threshold": settings.PREDICTION_THRESHOLD,
+                "uncertainty_band": settings.CASCADE_UNCERTAINTY_BAND,
+                "since": self.started_at.isoformat(),
+                "requests": self.requests,
+                "escalations": self.escalations,
+                "escalation_rate": round(self.escalations / self.requests, 4) if self.requests else 0.0,
+                # How often the second stage disagreed with the first; near zero suggests the band is too wide
+                "escalation_label_flip_rate": round(self.label_flips / self.escalations, 4) if self.escalations else 0.0,
+                "avg_stage1_ms": round(avg_stage1_ms, 3),
+                "avg_stage2_ms": round(avg_stage2_ms, 3),
+                "estimated_latency_saved_ms": round(settled * avg_stage2_ms - self.requests * avg_stage1_ms, 3),
+                "stage1_score_histogram": {
+                    f"{index * SCORE_BUCKET_WIDTH:.2f}-{(index + 1) * SCORE_BUCKET_WIDTH:.2f}": count
+                    for index, count in enumerate(self.score_buckets)
+                },
+            }
+
+
+cascade_stats = CascadeStats()
@@ -1,5 +1,205 @@
+from typing import Optional, Tuple
+from fastapi import HTTPException
 from PIL import Image
 import numpy as np
+import pydicom
+import io
+import os
+from utils.logging_config import setup_logger
+
+logger = setup_logger(__name__)
+
+NPY_CONTENT_TYPE = "application/x-npy"
+RAW_CONTENT_TYPE = "application/octet-stream"
+
+# Headroom allowed on top of the pixel payload for the .npy header
+NPY_HEADER_MAX_BYTES = 4096
+
+# Spatial size every model in the API is trained on
+MODEL_IMAGE_SIZE = (512, 512)
+
+# Encoded grayscale uploads below this size are rejected by /classify as not a real scan
+MIN_IMAGE_BYTES = 10240
+
+SUPPORTED_DICOM_MODALITIES = {"MR"}
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+DICOM_EXTENSIONS = {".dcm"}
 
 def preprocess_image(image: Image.Image) -> np.ndarray:
     return np.asarray(image) / 255.0
+
+
+def decode_image_bytes(body: bytes, mode: str, min_bytes: int = 0) -> np.ndarray:
+    """
+    Decodes an encoded image (PNG, JPEG, ...) to a uint8 array in the given PIL
+    mode ("L" or "RGB"), resized to the model image size. Bodies smaller than
+    min_bytes are rejected before decoding.
+    """
+    if len(body) < min_bytes:
+        raise HTTPException(status_code=400, detail="Image file too small to be valid.")
+
+    try:
+        image = Image.open(io.BytesIO(body)).convert(mode)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {str(e)}")
+
+    if image.size != MODEL_IMAGE_SIZE:
+        logger.debug(f"Resizing image from {image.size} to {MODEL_IMAGE_SIZE}")
+        image = image.resize(MODEL_IMAGE_SIZE)
+
+    return np.asarray(image)
+
+
+def read_dicom(body: bytes) -> pydicom.Dataset:
+    """
+    Parses a DICOM file without decoding its pixel data, so the header can be
+    checked before any expensive work is done.
+    """
+    return pydicom.dcmread(io.BytesIO(body))
+
+
+def check_dicom_modality(ds: pydicom.Dataset) -> str:
+    """
+    Returns the DICOM Modality, rejecting unsupported ones with a 400 before
+    the pixel data is touched.
+    """
+    modality = getattr(ds, "Modality", None)
+    if modality not in SUPPORTED_DICOM_MODALITIES:
+        logger.warning(f"Rejected DICOM with unsupported Modality: {modality}")
+        raise HTTPException(status_code=400, detail="Only MR modality DICOMs are supported.")
+
+    return modality
+
+
+def dicom_to_array(ds: pydicom.Dataset, mode: str = "L") -> np.ndarray:
+    """
+    Rescales the DICOM pixels to uint8 and returns them in the given PIL mode,
+    resized to the model image size.
+    """
+    # Extract pixel array and stretch it to [0, 1]
+    pixel_array = ds.pixel_array.astype(np.float32)
+    pixel_array -= pixel_array.min()
+    pixel_array /= pixel_array.max() if pixel_array.max() != 0 else 1
+
+    image = Image.fromarray((pixel_array * 255).astype(np.uint8)).convert(mode)
+
+    if image.size != MODEL_IMAGE_SIZE:
+        image = image.resize(MODEL_IMAGE_SIZE)
+
+    return np.asarray(image)
+
+
+def load_file_array(path: str, mode: str, min_image_bytes: int = 0) -> Tuple[Optional[np.ndarray], Optional[str], Optional[str]]:
+    """
+    Decodes an image or DICOM file from disk the same way the classify endpoints
+    decode uploads; min_image_bytes applies to images only, as on /classify.
+    Returns (array, modality, error): modality is None for images, and on
+    failure array is None and error describes why.
+
+    Never raises, because it runs in a process pool and FastAPI's HTTPException
+    cannot be unpickled in the parent; one bad file would break the whole pool.
+    Kept free of TensorFlow so it can run in lightweight worker processes.
+    """
+    try:
+        with open(path, "rb") as source:
+            body = source.read()
+
+        if os.path.splitext(path)[1].lower() in DICOM_EXTENSIONS:
+            ds = read_dicom(body)
+            modality = check_dicom_modality(ds)
+            return dicom_to_array(ds, mode), modality, None
+
+        return decode_image_bytes(body, mode, min_image_bytes), None, None
+    except HTTPException as e:
+        return None, None, str(e.detail)
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {str(e)}"
+
+
+def expected_tensor_bytes(input_shape: Tuple[Optional[int], ...]) -> int:
+    """
+    Upper bound on the body size of a raw uint8 upload for a model, used to
+    reject oversized bodies before they are read.
+    """
+    return int(np.prod(input_shape[1:])) + NPY_HEADER_MAX_BYTES
+
+
+def decode_npy(body: bytes) -> np.ndarray:
+    """
+    Maps a .npy payload onto a uint8 array without copying the pixel data.
+    """
+    stream = io.BytesIO(body)
+
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        else:
+            raise ValueError(f"unsupported .npy version {version}")
+    except Exception as e:
+        # read_array_header_* can also raise SyntaxError/TypeError/KeyError on malformed headers
+        raise HTTPException(status_code=400, detail=f"Invalid .npy payload: {str(e)}")
+
+    if dtype != np.uint8:
+        raise HTTPException(status_code=400, detail=f"Tensor dtype must be uint8, got {dtype}")
+
+    if fortran_order:
+        raise HTTPException(status_code=400, detail="Fortran-ordered .npy arrays are not supported")
+
+    return _map_buffer(body, shape, offset=stream.tell())
+
+
+def decode_raw_tensor(body: bytes, shape_header: Optional[str], dtype_header: Optional[str]) -> np.ndarray:
+    """
+    Maps a headerless uint8 payload onto an array using the shape and dtype sent
+    in the X-Tensor-Shape (e.g. "512,512,3") and X-Tensor-Dtype headers.
+    """
+    if not shape_header:
+        raise HTTPException(status_code=400, detail="X-Tensor-Shape header is required for raw uploads")
+
+    if (dtype_header or "uint8").lower() != "uint8":
+        raise HTTPException(status_code=400, detail=f"Tensor dtype must be uint8, got {dtype_header}")
+
+    try:
+        shape = tuple(int(dim) for dim in shape_header.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Tensor-Shape header: {shape_header}")
+
+    return _map_buffer(body, shape, offset=0)
+
+
+def _check_shape(shape: Tuple[int, ...]):
+    if not shape or any(dim <= 0 for dim in shape):
+        raise HTTPException(status_code=400, detail=f"Tensor shape {shape} must have positive dimensions")
+
+
+def _map_buffer(body: bytes, shape: Tuple[int, ...], offset: int) -> np.ndarray:
+    _check_shape(shape)
+    count = int(np.prod(shape))
+
+    if len(body) - offset != count:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tensor payload has {len(body) - offset} bytes, expected {count} for shape {shape}"
+        )
+
+    return np.frombuffer(body, dtype=np.uint8, count=count, offset=offset).reshape(shape)
+
+
+def tensor_to_batch(array: np.ndarray, input_shape: Tuple[Optional[int], ...]) -> np.ndarray:
+    """
+    Checks a uint8 tensor against the model input shape and returns a normalized
+    batch of one, ready for model.predict. Single-channel models also accept (H, W).
+    """
+    sample_shape = tuple(input_shape[1:])
+
+    if array.shape != sample_shape and not (sample_shape[-1] == 1 and array.shape == sample_shape[:-1]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tensor shape {array.shape} does not match model input shape {sample_shape}"
+        )
+
+    return (array / 255.0).reshape((1,) + sample_shape)
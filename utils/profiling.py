@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import shutil
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+import numpy as np
+import tensorflow as tf
+from fastapi import HTTPException
+from utils.logging_config import setup_logger
+from core.config import settings
+
+logger = setup_logger(__name__)
+
+PROFILING_DIR = settings.PROFILING_DIR
+
+# Allocations are kept only when one of these files is on the traceback
+PREPROCESSING_FILES = ["*/routers/classify_router.py", "*/utils/image_utils.py"]
+
+TRACEMALLOC_FRAMES = 25
+
+
+def artifact_base(prefix: str) -> str:
+    """
+    Returns a timestamped path without extension inside PROFILING_DIR.
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    return os.path.join(PROFILING_DIR, f"{prefix}-{stamp}")
+
+
+def resolve_artifact(name: str) -> str:
+    """
+    Maps an artifact name back to its file, refusing anything outside PROFILING_DIR.
+    """
+    if os.path.basename(name) != name:
+        raise HTTPException(status_code=400, detail="Invalid artifact name")
+
+    path = os.path.join(PROFILING_DIR, name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    return path
+
+
+def list_artifacts() -> list:
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+
+    return sorted(
+        (
+            {"name": name, "size_bytes": os.path.getsize(os.path.join(PROFILING_DIR, name))}
+            for name in os.listdir(PROFILING_DIR)
+            if os.path.isfile(os.path.join(PROFILING_DIR, name))
+        ),
+        key=lambda artifact: artifact["name"],
+        reverse=True
+    )
+
+
+def prune_artifacts(keep=()):
+    """
+    Deletes the oldest artifacts until PROFILING_DIR is within both the
+    PROFILING_MAX_ARTIFACTS count and PROFILING_MAX_ARTIFACT_MB size caps,
+    so repeated captures on a live worker cannot fill the disk. Paths in keep
+    (the capture just taken) are counted but never deleted.
+    """
+    if not os.path.isdir(PROFILING_DIR):
+        return
+
+    paths = [os.path.join(PROFILING_DIR, name) for name in os.listdir(PROFILING_DIR)]
+    files = sorted((path for path in paths if os.path.isfile(path)), key=os.path.getmtime)
+
+    max_bytes = settings.PROFILING_MAX_ARTIFACT_MB * 1024 * 1024
+    total_bytes = sum(os.path.getsize(path) for path in files)
+
+    keep = {os.path.abspath(path) for path in keep}
+    count = len(files)
+    candidates = [path for path in files if os.path.abspath(path) not in keep]
+
+    while candidates and (count > settings.PROFILING_MAX_ARTIFACTS or total_bytes > max_bytes):
+        oldest = candidates.pop(0)
+        count -= 1
+        total_bytes -= os.path.getsize(oldest)
+        try:
+            os.remove(oldest)
+            logger.info(f"Pruned profiling artifact {os.path.basename(oldest)}")
+        except OSError as e:
+            logger.warning(f"Failed to prune profiling artifact {oldest}: {e}")
+
+
+class CpuSampler:
+    """
+    Wall-clock sampling profiler. A background thread snapshots the stack of
+    every other thread at a fixed interval, so handlers are never instrumented
+    and nothing runs once the capture window closes. Stacks are written in the
+    collapsed format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_seconds: float, loop_thread_id: int):
+        self.interval_seconds = interval_seconds
+        self.loop_thread_id = loop_thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cpu-sampler", daemon=True)
+
+    def _thread_label(self, thread_id: int, names: dict) -> str:
+        if thread_id == self.loop_thread_id:
+            return "event-loop"
+        return names.get(thread_id, f"thread-{thread_id}")
+
+    def _run(self):
+        own_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+
+                stack.append(self._thread_label(thread_id, names))
+                self.stacks[";".join(reversed(stack))] += 1
+
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+class AllocationTracer:
+    """
+    tracemalloc capture of the preprocessing path. A snapshot taken only at the
+    end of the window misses buffers from requests that already finished, so a
+    background thread polls traced memory and re-snapshots whenever it reaches a
+    new peak (at most once per PEAK_SNAPSHOT_MIN_SECONDS). The report shows the
+    allocations live at the peak, plus the growth between the start and end
+    snapshots for anything retained.
+    """
+
+    POLL_SECONDS = 0.02
+    PEAK_SNAPSHOT_MIN_SECONDS = 0.5
+    # Only re-snapshot once a new peak is this much above the last one
+    PEAK_GROWTH = 1.05
+
+    def __init__(self):
+        self.start_snapshot = None
+        self.peak_snapshot = None
+        self.peak_bytes = 0
+        self.peak_snapshots_taken = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="alloc-peak-tracker", daemon=True)
+
+    def _filtered_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, pattern, all_frames=True) for pattern in PREPROCESSING_FILES]
+        )
+
+    def _run(self):
+        last_snapshot_at = 0.0
+
+        while not self._stop.wait(self.POLL_SECONDS):
+            current, _ = tracemalloc.get_traced_memory()
+            now = time.monotonic()
+
+            if current > self.peak_bytes * self.PEAK_GROWTH and now - last_snapshot_at >= self.PEAK_SNAPSHOT_MIN_SECONDS:
+                self.peak_snapshot = self._filtered_snapshot()
+                self.peak_bytes = current
+                self.peak_snapshots_taken += 1
+                last_snapshot_at = now
+
+    def start(self):
+        if tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="tracemalloc is already running in this process")
+
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.start_snapshot = self._filtered_snapshot()
+        self._thread.start()
+
+    def stop(self, base: str, top: int) -> list:
+        """
+        Stops tracing and writes a readable report plus the raw peak snapshot
+        for tracemalloc.Snapshot.load.
+        """
+        self._stop.set()
+        self._thread.join()
+
+        try:
+            end_snapshot = self._filtered_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        peak_snapshot = self.peak_snapshot or end_snapshot
+        peak_snapshot.dump(base + ".tracemalloc")
+
+        peak_stats = peak_snapshot.statistics("traceback")
+        growth_stats = [stat for stat in end_snapshot.compare_to(self.start_snapshot, "traceback") if stat.size_diff > 0]
+
+        with open(base + ".txt", "w") as output:
+            output.write(f"Process-wide traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+            output.write(f"Peak snapshots taken: {self.peak_snapshots_taken} (last at {self.peak_bytes / 1024:.1f} KiB traced)\n")
+            output.write(f"Raw peak snapshot: {os.path.basename(base)}.tracemalloc\n\n")
+
+            output.write(f"== Preprocessing allocations live at peak: {sum(stat.size for stat in peak_stats) / 1024:.1f} KiB ==\n\n")
+            for index, stat in enumerate(peak_stats[:top], start=1):
+                output.write(f"#{index}: {stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                for line in stat.traceback.format():
+                    output.write(f"    {line}\n")
+                output.write("\n")
+
+            output.write(f"== Preprocessing growth from start to end of window: {sum(stat.size_diff for stat in growth_stats) / 1024:.1f} KiB ==\n\n")
+            for index, stat in enumerate(growth_stats[:top], start=1):
+                output.write(f"#{index}: +{stat.size_diff / 1024:.1f} KiB, +{stat.count_diff} blocks\n")
+                for line in stat.traceback.format():
+                    output.write(f"    {line}\n")
+                output.write("\n")
+
+        return [base + ".txt", base + ".tracemalloc"]
+
+
+def start_tf_trace(logdir: str):
+    tf.profiler.experimental.start(logdir)
+
+
+def stop_tf_trace(logdir: str) -> str:
+    """
+    Stops the TensorFlow profiler and zips the trace directory for download.
+    The archive opens in TensorBoard's Profile tab once extracted.
+    """
+    tf.profiler.experimental.stop()
+
+    archive = shutil.make_archive(logdir, "zip", root_dir=logdir)
+    shutil.rmtree(logdir, ignore_errors=True)
+    return archive
+
+
+def predict_for(model, seconds: float):
+    """
+    Keeps calling model.predict on a blank batch for the capture window, for
+    when there is not enough live traffic to show up in the trace.
+    """
+    blank = np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        model.predict(blank, verbose=0)